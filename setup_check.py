@@ -5,17 +5,34 @@ Run this first before test_audio.py
 """
 
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-def check_import(name: str, package: str = None) -> bool:
-    """Try importing a module and report success/failure."""
-    package = package or name
+def try_import(name: str) -> str:
+    """Try importing a module. Returns the error message, or '' on success."""
     try:
         __import__(name)
-        print(f"✓ {package}")
-        return True
+        return ""
     except ImportError as e:
-        print(f"✗ {package} - {e}")
-        return False
+        return str(e)
+
+def check_imports(names: list) -> bool:
+    """
+    Import modules on a thread pool and report success/failure in the
+    order given. Only the file-system part of each import (finding and
+    reading modules) can overlap; extension loading and init run under
+    the GIL, so the speedup is modest.
+    """
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        errors = list(executor.map(try_import, names))
+    
+    all_ok = True
+    for name, error in zip(names, errors):
+        if error:
+            print(f"✗ {name} - {error}")
+            all_ok = False
+        else:
+            print(f"✓ {name}")
+    return all_ok
 
 def main():
     print("=" * 50)
@@ -24,11 +41,7 @@ def main():
     
     # Check all required imports
     print("\n1. Checking dependencies...")
-    all_ok = True
-    all_ok &= check_import("sounddevice")
-    all_ok &= check_import("soundfile")
-    all_ok &= check_import("numpy")
-    all_ok &= check_import("pvporcupine")
+    all_ok = check_imports(["sounddevice", "soundfile", "numpy", "pvporcupine"])
     
     if not all_ok:
         print("\n⚠ Some dependencies missing.")
@@ -40,12 +53,16 @@ def main():
     print("\n2. Checking audio devices...")
     import sounddevice as sd
     
+    # Enumerate devices once; PortAudio enumeration is slow
+    devices = sd.query_devices()
+    default_in, default_out = sd.default.device
+    
     # List input devices
     print("\nInput devices (microphones):")
-    inputs = [d for d in sd.query_devices() if d['max_input_channels'] > 0]
+    inputs = [d for d in devices if d['max_input_channels'] > 0]
     if inputs:
         for d in inputs:
-            marker = "→" if d['index'] == sd.default.device[0] else " "
+            marker = "→" if d['index'] == default_in else " "
             print(f"  {marker} [{d['index']}] {d['name']} ({d['max_input_channels']} ch)")
     else:
         print("  ✗ No input devices found!")
@@ -53,10 +70,10 @@ def main():
     
     # List output devices
     print("\nOutput devices (speakers):")
-    outputs = [d for d in sd.query_devices() if d['max_output_channels'] > 0]
+    outputs = [d for d in devices if d['max_output_channels'] > 0]
     if outputs:
         for d in outputs:
-            marker = "→" if d['index'] == sd.default.device[1] else " "
+            marker = "→" if d['index'] == default_out else " "
             print(f"  {marker} [{d['index']}] {d['name']} ({d['max_output_channels']} ch)")
     else:
         print("  ✗ No output devices found!")
@@ -8,10 +8,11 @@ Environment Variables:
 """
 
 import sys
-import time
+import atexit
+import functools
 import os
 import subprocess
-import tempfile
+import threading
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
@@ -34,50 +35,73 @@ ALSA_PLAYBACK_DEVICE = os.environ.get("ALSA_DEVICE", "plughw:0,0")
 # Sound Generation Utilities
 # ============================================================
 
+# Wavetable for sine synthesis, indexed by the top bits of a 32-bit phase
+SINE_TABLE_BITS = 12
+_SINE_LUT = np.sin(
+    2 * np.pi * np.arange(1 << SINE_TABLE_BITS) / (1 << SINE_TABLE_BITS)
+).astype(np.float32)
+
+
+def _wavetable_sine(freq, n: int, sr: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Look up n samples of a sine wave from the wavetable.
+    freq may be a scalar or a column of frequencies (one row per tone).
+    If out is given, samples are written into it instead of a new array.
+    """
+    # Fixed-point phase increment (2**32 per cycle). Phase is kept as intp so
+    # take() uses it as-is; mode='wrap' drops the whole cycles above the
+    # table bits, so no index copy or output buffer is needed
+    step = np.round(np.asarray(freq, dtype=np.float64) * (2 ** 32 / sr)).astype(np.intp)
+    phase = np.arange(n, dtype=np.intp) * step
+    np.right_shift(phase, 32 - SINE_TABLE_BITS, out=phase)
+    return np.take(_SINE_LUT, phase, out=out, mode='wrap')
+
+
+@functools.lru_cache(maxsize=None)
 def generate_chime(sr: int = 16000) -> np.ndarray:
     """
     Generate a pleasant success chime sound.
     Two-note ascending arpeggio (C5 → E5 → G5).
+    The result is cached and read-only; copy it before modifying.
     """
     notes = [523.25, 659.25, 783.99]  # C5, E5, G5
     note_duration = 0.15
+    n = int(sr * note_duration)
     
-    chime = np.array([], dtype=np.float32)
-    for freq in notes:
-        t = np.linspace(0, note_duration, int(sr * note_duration), dtype=np.float32)
-        # Sine wave with envelope (fade in/out)
-        envelope = np.sin(np.pi * t / note_duration)
-        note = 0.4 * envelope * np.sin(2 * np.pi * freq * t)
-        chime = np.concatenate([chime, note])
+    chime = np.empty(len(notes) * n, dtype=np.float32)
+    # Sine wave with envelope (fade in/out), note gain folded in
+    envelope = 0.4 * np.sin(np.pi * np.arange(n, dtype=np.float32) * (1.0 / n))
+    for i, freq in enumerate(notes):
+        np.multiply(envelope, _wavetable_sine(freq, n, sr), out=chime[i * n:(i + 1) * n])
     
+    chime.setflags(write=False)
     return chime
 
 
+@functools.lru_cache(maxsize=None)
 def generate_music_sample(sr: int = 16000, duration: float = 3.0) -> np.ndarray:
     """
     Generate a simple melodic sample (ascending scale with harmony).
+    The result is cached and read-only; copy it before modifying.
     """
-    t = np.linspace(0, duration, int(sr * duration), dtype=np.float32)
-    
     # Base melody: simple ascending pattern
     melody_freqs = [262, 294, 330, 349, 392, 440, 494, 523]  # C4 to C5
-    samples_per_note = len(t) // len(melody_freqs)
+    samples_per_note = int(sr * duration) // len(melody_freqs)
     
-    audio = np.zeros_like(t)
-    for i, freq in enumerate(melody_freqs):
-        start = i * samples_per_note
-        end = start + samples_per_note
-        if end > len(t):
-            end = len(t)
-        segment = t[start:end] - t[start]
-        # Add main note + fifth harmony
-        envelope = np.sin(np.pi * np.linspace(0, 1, end - start))
-        audio[start:end] = envelope * (
-            0.3 * np.sin(2 * np.pi * freq * segment) +
-            0.15 * np.sin(2 * np.pi * freq * 1.5 * segment)  # fifth
-        )
+    # One row per note, rendered in a single vectorized pass
+    freqs = np.array(melody_freqs, dtype=np.float64)[:, None]
+    envelope = 0.3 * np.sin(np.pi * np.arange(samples_per_note, dtype=np.float32) * (1.0 / samples_per_note))
+    notes = np.empty((len(melody_freqs), samples_per_note), dtype=np.float32)
+    scratch = np.empty_like(notes)
+    # Add main note + fifth harmony at half level, accumulating in place
+    _wavetable_sine(freqs * 1.5, samples_per_note, sr, out=notes)  # fifth
+    notes *= 0.5
+    notes += _wavetable_sine(freqs, samples_per_note, sr, out=scratch)
+    notes *= envelope
     
-    return audio.astype(np.float32)
+    music = notes.reshape(-1)
+    music.setflags(write=False)
+    return music
 
 
 # ============================================================
@@ -98,8 +122,8 @@ def play_with_aplay(wav_path: str, device: str = None) -> bool:
     try:
         result = subprocess.run(
             ["aplay", "-D", device, wav_path],
-            capture_output=True,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
             timeout=30
         )
         return result.returncode == 0
@@ -110,20 +134,37 @@ def play_with_aplay(wav_path: str, device: str = None) -> bool:
 
 def play_tone_with_aplay(tone: np.ndarray, sample_rate: int, device: str = None) -> bool:
     """
-    Generate tone and play via aplay.
-    Saves to temp WAV, plays, then cleans up.
+    Play a generated tone via aplay.
+    Pipes raw 16-bit PCM to aplay's stdin, so no temp WAV is needed.
     """
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
-        temp_path = f.name
-    
+    device = device or ALSA_PLAYBACK_DEVICE
+    pcm = np.clip(tone * 32767, -32768, 32767).astype('<i2').tobytes()
     try:
-        sf.write(temp_path, tone, sample_rate, subtype='PCM_16')
-        return play_with_aplay(temp_path, device)
-    finally:
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
+        result = subprocess.run(
+            ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-r", str(sample_rate), "-c", "1",
+             "-D", device],
+            input=pcm,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+        return result.returncode == 0
+    except Exception as e:
+        print(f"    aplay error: {e}")
+        return False
+
+
+def warm_up_audio():
+    """
+    Open the capture and playback devices once before the first step,
+    so device-open latency is paid during setup rather than mid-test.
+    """
+    try:
+        sd.rec(16, samplerate=SAMPLE_RATE, channels=1, dtype=np.float32, blocking=True)
+    except Exception:
+        pass  # step_record reports recording problems
+    play_tone_with_aplay(np.zeros(SAMPLE_RATE // 100, dtype=np.float32), SAMPLE_RATE,
+                         ALSA_PLAYBACK_DEVICE)
 
 
 def step_record():
@@ -143,12 +184,12 @@ def step_record():
             int(RECORD_DURATION * SAMPLE_RATE),
             samplerate=SAMPLE_RATE,
             channels=1,
-            dtype=np.float32
+            dtype=np.int16
         )
         sd.wait()
         
-        # Save to file
-        sf.write(RECORDING_FILE, recording, SAMPLE_RATE)
+        # Save to file as 16-bit PCM (half the size of float WAV)
+        sf.write(RECORDING_FILE, recording, SAMPLE_RATE, format='WAV', subtype='PCM_16')
         print(f"✓ Recording saved to {RECORDING_FILE}")
         return True
     except Exception as e:
@@ -207,6 +248,17 @@ def step_play_music():
         return False
 
 
+@functools.lru_cache(maxsize=4)
+def get_porcupine(access_key: str, keywords: tuple):
+    """
+    Create a Porcupine instance, cached per (access_key, keywords) so the
+    model is loaded once per session. Instances are deleted at exit.
+    """
+    porcupine = pvporcupine.create(access_key=access_key, keywords=list(keywords))
+    atexit.register(porcupine.delete)
+    return porcupine
+
+
 def step_wake_word():
     """Step 4: Test wake word detection with Porcupine."""
     print("\n" + "=" * 50)
@@ -218,72 +270,60 @@ def step_wake_word():
     
     wait_for_enter("Press ENTER to start listening...")
     
-    porcupine = None
     stream = None
     
     try:
-        # Initialize Porcupine
-        porcupine = pvporcupine.create(
-            access_key=PICOVOICE_KEY,
-            keywords=["porcupine"]
-        )
+        # Initialize Porcupine (reused if this step runs again)
+        porcupine = get_porcupine(PICOVOICE_KEY, ("porcupine",))
         
         frame_length = porcupine.frame_length  # typically 512 samples
         
         print(f"\n👂 Listening for 'Porcupine'... (30 second timeout)")
         print("   Frame length: {}, Sample rate: {}".format(frame_length, porcupine.sample_rate))
         
-        # Create audio buffer
-        audio_buffer = []
-        detected = False
-        start_time = time.time()
+        detected_evt = threading.Event()
+        callback_result = {'error': None}
         timeout = 30  # seconds
         
         def audio_callback(indata, frames, time_info, status):
-            """Callback to collect audio frames."""
+            """Callback to run Porcupine on each audio frame."""
             if status:
                 print(f"   Audio status: {status}")
-            # Convert to int16 as required by Porcupine
-            audio_buffer.extend(indata[:, 0].tolist())
+            # blocksize is one Porcupine frame, so each block is processed
+            # directly; for mono input reshape(-1) is a view, not a copy
+            try:
+                keyword_index = porcupine.process(indata.reshape(-1))
+            except Exception as e:
+                # Hand the error to the main thread instead of letting
+                # PortAudio swallow it
+                callback_result['error'] = e
+                detected_evt.set()
+                raise sd.CallbackAbort
+            if keyword_index >= 0:
+                detected_evt.set()
+                raise sd.CallbackStop
         
         # Start audio stream
         stream = sd.InputStream(
             samplerate=porcupine.sample_rate,
             channels=1,
-            dtype=np.float32,
+            dtype=np.int16,  # Porcupine consumes int16 PCM directly
             blocksize=frame_length,
             callback=audio_callback
         )
         stream.start()
         
-        # Process audio frames
-        while time.time() - start_time < timeout:
-            # Wait for enough samples
-            if len(audio_buffer) >= frame_length:
-                # Get frame and convert to int16
-                frame = np.array(audio_buffer[:frame_length])
-                audio_buffer = audio_buffer[frame_length:]
-                
-                # Convert float32 to int16
-                frame_int16 = (frame * 32767).astype(np.int16)
-                
-                # Process with Porcupine
-                keyword_index = porcupine.process(frame_int16)
-                
-                if keyword_index >= 0:
-                    print("\n🎉 Wake word 'Porcupine' detected!")
-                    detected = True
-                    break
-            else:
-                time.sleep(0.01)
-        
+        detected = detected_evt.wait(timeout)
         stream.stop()
         
+        if callback_result['error'] is not None:
+            raise callback_result['error']
+        
         if detected:
+            print("\n🎉 Wake word 'Porcupine' detected!")
             # Play success chime via aplay (bypasses broken ALSA chains)
             print("   Playing success chime...")
-            chime = generate_chime(SAMPLE_RATE)
-            play_tone_with_aplay(chime, SAMPLE_RATE, ALSA_PLAYBACK_DEVICE)
+            play_tone_with_aplay(generate_chime(SAMPLE_RATE), SAMPLE_RATE, ALSA_PLAYBACK_DEVICE)
             print("✓ Wake word test passed!")
             return True
         else:
@@ -299,8 +339,6 @@ def step_wake_word():
     finally:
         if stream:
             stream.close()
-        if porcupine:
-            porcupine.delete()
 
 
 # ============================================================
@@ -317,6 +355,8 @@ def main():
     print("  3. Play a music sample")
     print("  4. Test wake word detection (Porcupine)")
     
+    warm_up_audio()
+    
     results = {}
     
     # Run each step
@@ -16,10 +16,10 @@ Usage:
 import subprocess
 import sys
 import os
-import time
 import tempfile
-import threading
+import wave
 import argparse
+import functools
 from dataclasses import dataclass
 from typing import Optional, Tuple, List
 import numpy as np
@@ -121,21 +121,77 @@ AUDIO_PATHS = [
 # Utility Functions
 # ============================================================
 
-def generate_tone(frequency: float, duration: float, sample_rate: int, amplitude: float = 0.8) -> np.ndarray:
-    """Generate a sine wave tone."""
-    t = np.linspace(0, duration, int(sample_rate * duration), dtype=np.float32)
-    # Add slight fade in/out to avoid clicks
+@functools.lru_cache(maxsize=1)
+def get_devices() -> Tuple[sd.DeviceList, Tuple[int, int]]:
+    """
+    Enumerate audio devices once per process (PortAudio scans are slow).
+    Returns (devices, (default_input_index, default_output_index)).
+    """
+    return sd.query_devices(), tuple(sd.default.device)
+
+
+def refresh_devices():
+    """Drop the cached device list, e.g. after a device is hot-plugged."""
+    get_devices.cache_clear()
+
+
+@functools.lru_cache(maxsize=8)
+def _generate_tone_cached(frequency: float, duration: float, sample_rate: int, amplitude: float) -> np.ndarray:
+    """Generate a sine wave tone once per parameter set (read-only result)."""
+    # Phase ramp built in place: one N-element buffer reused for the sine
+    phase = np.arange(int(sample_rate * duration), dtype=np.float32)
+    phase *= np.float32(2 * np.pi * frequency / sample_rate)
+    tone = np.sin(phase, out=phase)
+    tone *= amplitude
+    # Add slight fade in/out to avoid clicks (only the edges need scaling)
     fade_samples = int(sample_rate * 0.05)
-    envelope = np.ones_like(t)
-    envelope[:fade_samples] = np.linspace(0, 1, fade_samples)
-    envelope[-fade_samples:] = np.linspace(1, 0, fade_samples)
-    tone = amplitude * envelope * np.sin(2 * np.pi * frequency * t)
-    return tone.astype(np.float32)
+    tone[:fade_samples] *= np.linspace(0, 1, fade_samples, dtype=np.float32)
+    tone[-fade_samples:] *= np.linspace(1, 0, fade_samples, dtype=np.float32)
+    tone.setflags(write=False)
+    return tone
+
+
+def generate_tone(frequency: float, duration: float, sample_rate: int, amplitude: float = 0.8,
+                  writable: bool = False) -> np.ndarray:
+    """
+    Generate a sine wave tone.
+    Returns a shared read-only array unless writable=True (then a copy).
+    """
+    tone = _generate_tone_cached(frequency, duration, sample_rate, amplitude)
+    return tone.copy() if writable else tone
+
+
+def _next_fast_len(n: int) -> int:
+    """Smallest length >= n of the form 2^a 3^b 5^c, where pocketfft is fastest."""
+    best = 1 << (n - 1).bit_length()  # next power of two
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            # Smallest power-of-two multiple of p35 that reaches n
+            quotient = -(-n // p35)
+            best = min(best, p35 << (quotient - 1).bit_length())
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+@functools.lru_cache(maxsize=4)
+def _hann_window(n: int) -> np.ndarray:
+    """Hann window of length n, built once per length (read-only)."""
+    window = np.hanning(n).astype(np.float32)
+    window.setflags(write=False)
+    return window
 
 
 def save_tone_wav(tone: np.ndarray, sample_rate: int, filepath: str):
-    """Save tone to WAV file for aplay."""
-    sf.write(filepath, tone, sample_rate, subtype='PCM_16')
+    """Save tone to a mono 16-bit PCM WAV file for aplay."""
+    pcm = np.clip(np.rint(tone * 32767.0), -32768, 32767).astype('<i2')
+    with wave.open(filepath, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
 
 
 def analyze_recording(recording: np.ndarray, sample_rate: int, expected_freq: float, verbose: bool = False) -> dict:
@@ -147,7 +203,7 @@ def analyze_recording(recording: np.ndarray, sample_rate: int, expected_freq: fl
         - peak: Peak amplitude
         - detected_freq: Dominant frequency found
         - freq_magnitude: Magnitude at expected frequency
-        - noise_floor: Average magnitude (noise)
+        - noise_floor: RMS magnitude of bins outside the tone region (noise)
         - snr: Signal-to-noise ratio
         - tone_detected: bool - was the tone found?
     """
@@ -156,38 +212,79 @@ def analyze_recording(recording: np.ndarray, sample_rate: int, expected_freq: fl
         recording = recording[:, 0]
     
     # Basic stats
-    rms = np.sqrt(np.mean(recording ** 2))
-    peak = np.max(np.abs(recording))
-    
-    # FFT analysis
+    rms = np.sqrt(np.dot(recording, recording) / len(recording))  # no recording**2 temporary
+    peak = max(recording.max(), -recording.min())  # no np.abs temporary
+    
+    # Nothing audible was captured: skip the spectrum entirely
+    if rms <= MIN_RMS_THRESHOLD:
+        if verbose:
+            print(f"      RMS: {rms:.6f}, Peak: {peak:.4f} (below threshold, FFT skipped)")
+        return {
+            'rms': rms,
+            'peak': peak,
+            'detected_freq': 0.0,
+            'freq_magnitude': 0.0,
+            'noise_floor': 0.0,
+            'snr': 0.0,
+            'tone_detected': False,
+            'freq_match': False,
+        }
+    
+    # FFT analysis (Hann-windowed, zero-padded to a fast FFT length)
     n = len(recording)
-    fft = np.fft.rfft(recording)
-    freqs = np.fft.rfftfreq(n, 1/sample_rate)
-    magnitudes = np.abs(fft) / n
+    nfast = _next_fast_len(n)
+    window = _hann_window(n)
+    window_sum = float(window.sum(dtype=np.float64))
+    # Remove any DC offset first: the window would spread it into bin 1,
+    # where it can outweigh a weak tone
+    windowed = recording - recording.mean()
+    windowed *= window
+    fft = np.fft.rfft(windowed, n=nfast)
+    # Work in squared magnitudes; only ratios are compared, so the per-bin
+    # sqrt and normalization are deferred to the few scalars reported
+    power = fft.real * fft.real
+    power += fft.imag * fft.imag
+    bin_width = sample_rate / nfast  # rfft bins are uniformly spaced
+    
+    def bin_of(freq: float) -> int:
+        """Index of the FFT bin nearest to freq."""
+        return min(max(int(round(freq / bin_width)), 0), len(power) - 1)
+    
+    # Skip DC and the bin next to it (the window's main lobe around DC)
+    first_bin = 2
     
     # Find dominant frequency
-    dominant_idx = np.argmax(magnitudes[1:]) + 1  # Skip DC
-    detected_freq = freqs[dominant_idx]
-    
-    # Get magnitude at expected frequency
-    freq_idx = np.argmin(np.abs(freqs - expected_freq))
-    freq_magnitude = magnitudes[freq_idx]
-    
-    # Calculate noise floor (average of magnitudes, excluding the tone region)
-    tone_region_start = np.argmin(np.abs(freqs - (expected_freq - 100)))
-    tone_region_end = np.argmin(np.abs(freqs - (expected_freq + 100)))
-    noise_magnitudes = np.concatenate([magnitudes[:tone_region_start], magnitudes[tone_region_end:]])
-    noise_floor = np.mean(noise_magnitudes) if len(noise_magnitudes) > 0 else 0.0001
+    dominant_idx = np.argmax(power[first_bin:]) + first_bin
+    detected_freq = dominant_idx * bin_width
+    
+    # Get power at expected frequency
+    freq_idx = bin_of(expected_freq)
+    freq_power = power[freq_idx]
+    
+    # Calculate noise floor (mean power, excluding DC and the tone region);
+    # a DC offset would otherwise dominate a mean of squared magnitudes
+    tone_region_start = max(bin_of(expected_freq - 100), first_bin)
+    tone_region_end = max(bin_of(expected_freq + 100), first_bin)
+    noise_count = len(power) - first_bin - (tone_region_end - tone_region_start)
+    # float64 accumulation keeps the subtraction from cancelling to noise
+    noise_total = (power[first_bin:].sum(dtype=np.float64)
+                   - power[tone_region_start:tone_region_end].sum(dtype=np.float64))
+    noise_power = noise_total / noise_count if noise_count > 0 else (0.0001 * window_sum) ** 2
+    
+    # Amplitudes for reporting; dividing by the window sum keeps the
+    # unwindowed |X| / n scale (half the amplitude of a pure tone)
+    freq_magnitude = np.sqrt(freq_power) / window_sum
+    noise_floor = np.sqrt(noise_power) / window_sum
     
     # Signal-to-noise ratio
     snr = freq_magnitude / noise_floor if noise_floor > 0 else 0
     
     # Detection criteria:
-    # 1. RMS above threshold (something is playing)
+    # 1. RMS above threshold (something is playing) - checked above
     # 2. Detected frequency close to expected
-    # 3. SNR above threshold (tone is distinct from noise)
+    # 3. SNR above threshold (tone is distinct from noise), compared in power
     freq_match = abs(detected_freq - expected_freq) < FREQ_TOLERANCE
-    tone_detected = (rms > MIN_RMS_THRESHOLD) and freq_match and (snr > SNR_THRESHOLD)
+    tone_detected = freq_match and (freq_power > SNR_THRESHOLD ** 2 * noise_power)
     
     result = {
         'rms': rms,
@@ -209,11 +306,21 @@ def analyze_recording(recording: np.ndarray, sample_rate: int, expected_freq: fl
     return result
 
 
-def record_audio(duration: float, sample_rate: int, channels: int = 1) -> np.ndarray:
+@functools.lru_cache(maxsize=1)
+def _record_buffer(frames: int, channels: int) -> np.ndarray:
+    """Capture buffer allocated once and reused for every recording."""
+    return np.empty((frames, channels), dtype=np.float32)
+
+
+def start_recording(duration: float, sample_rate: int, channels: int = 1) -> dict:
     """
-    Record audio using arecord (more reliable than PortAudio on ReSpeaker).
-    Falls back to sounddevice if arecord fails.
+    Start recording in the background using arecord (more reliable than
+    PortAudio on ReSpeaker). Falls back to sounddevice if arecord fails.
+    
+    Returns a handle to pass to finish_recording().
     """
+    buffer = _record_buffer(int(duration * sample_rate), channels)
+    
     # Try arecord first (bypasses PortAudio issues)
     with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
         temp_path = f.name
@@ -229,29 +336,67 @@ def record_audio(duration: float, sample_rate: int, channels: int = 1) -> np.nda
             "-d", str(int(duration)),
             temp_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=duration + 5)
-        
-        if result.returncode == 0 and os.path.exists(temp_path):
-            data, sr = sf.read(temp_path)
-            return data.astype(np.float32)
-    except Exception as e:
-        print(f"      arecord failed: {e}, trying sounddevice...")
-    finally:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # arecord exits almost immediately if it cannot open the device;
+        # catch that now so the fallback still captures during playback
         try:
-            os.unlink(temp_path)
-        except:
+            proc.wait(timeout=0.1)
+        except subprocess.TimeoutExpired:
             pass
+        if proc.returncode is None or proc.returncode == 0:
+            return {'proc': proc, 'path': temp_path, 'buffer': buffer, 'timeout': duration + 5}
+        error = proc.stderr.read().decode(errors='replace').strip()
+        proc.stderr.close()
+        print(f"      arecord failed: {error}, trying sounddevice...")
+    except Exception as e:
+        print(f"      arecord failed: {e}, trying sounddevice...")
     
-    # Fallback to sounddevice
     try:
-        frames = int(duration * sample_rate)
-        recording = sd.rec(frames, samplerate=sample_rate, channels=channels, dtype=np.float32)
-        sd.wait()
-        return recording
+        os.unlink(temp_path)
+    except:
+        pass
+    
+    # Fallback to sounddevice (sd.rec returns immediately). The whole buffer
+    # is returned even if the capture is cut short (sd.play() stops it), so
+    # clear the previous recording rather than analyzing it again
+    buffer.fill(0)
+    try:
+        sd.rec(samplerate=sample_rate, out=buffer)
+        return {'proc': None, 'path': None, 'buffer': buffer, 'timeout': None}
     except Exception as e:
         raise RuntimeError(f"Both arecord and sounddevice failed: {e}")
 
 
+def finish_recording(handle: dict) -> np.ndarray:
+    """
+    Wait for a recording started by start_recording() and return it.
+    
+    The result is a view of a shared buffer and is only valid until the
+    next recording.
+    """
+    proc = handle['proc']
+    if proc is None:
+        sd.wait()
+        return handle['buffer']
+    
+    try:
+        try:
+            _, stderr = proc.communicate(timeout=handle['timeout'])
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise RuntimeError("arecord timed out")
+        if proc.returncode != 0 or not os.path.exists(handle['path']):
+            raise RuntimeError(f"arecord failed: {stderr.decode(errors='replace').strip()}")
+        data, sr = sf.read(handle['path'], dtype='float32', out=handle['buffer'])
+        return data
+    finally:
+        try:
+            os.unlink(handle['path'])
+        except:
+            pass
+
+
 # ============================================================
 # Playback Methods
 # ============================================================
@@ -260,11 +405,12 @@ def play_with_aplay(wav_path: str, device: str, timeout: float = 5.0) -> Tuple[b
     """Play WAV file using aplay with specified device."""
     cmd = ["aplay", "-D", device, wav_path]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        # stdout is never used; stderr is only decoded on failure
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
         if result.returncode == 0:
             return True, ""
         else:
-            return False, result.stderr.strip()
+            return False, result.stderr.decode(errors='replace').strip()
     except subprocess.TimeoutExpired:
         return False, "Timeout"
     except Exception as e:
@@ -282,11 +428,11 @@ def play_with_mpv(url_or_file: str, device: str, duration: float = 3.0) -> Tuple
         url_or_file
     ]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=duration + 2)
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=duration + 2)
         if result.returncode == 0:
             return True, ""
         else:
-            return False, result.stderr.strip()[:100]
+            return False, result.stderr.decode(errors='replace').strip()[:100]
     except subprocess.TimeoutExpired:
         return True, ""  # Timeout is expected for length limit
     except Exception as e:
@@ -306,9 +452,10 @@ def play_with_sounddevice(tone: np.ndarray, sample_rate: int, device: Optional[s
 # Test Runner
 # ============================================================
 
-def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: str, verbose: bool = False) -> dict:
+def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: Optional[str], verbose: bool = False) -> dict:
     """
     Test a single audio path by playing tone and recording simultaneously.
+    wav_path may be None for paths that play through sounddevice.
     
     Returns dict with test results.
     """
@@ -338,20 +485,13 @@ def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: str, verbose: b
     print(f"\n  Testing: {path.name}")
     print(f"    Method: {playback_method}, Target: {playback_target}")
     
-    # Start recording in background thread
-    recording_result = {'data': None, 'error': None}
-    
-    def record_thread():
-        try:
-            recording_result['data'] = record_audio(RECORD_DURATION, SAMPLE_RATE, channels=1)
-        except Exception as e:
-            recording_result['error'] = str(e)
-    
-    recorder = threading.Thread(target=record_thread)
-    recorder.start()
-    
-    # Small delay to ensure recording starts
-    time.sleep(0.3)
+    # Start recording in the background
+    recording_handle = None
+    recording_error = None
+    try:
+        recording_handle = start_recording(RECORD_DURATION, SAMPLE_RATE, channels=1)
+    except Exception as e:
+        recording_error = str(e)
     
     # Play the tone
     if playback_method == 'aplay':
@@ -362,7 +502,12 @@ def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: str, verbose: b
         playback_ok, playback_error = play_with_sounddevice(tone, SAMPLE_RATE)
     
     # Wait for recording to finish
-    recorder.join(timeout=RECORD_DURATION + 2)
+    recording = None
+    if recording_handle:
+        try:
+            recording = finish_recording(recording_handle)
+        except Exception as e:
+            recording_error = str(e)
     
     result['playback_ok'] = playback_ok
     result['playback_error'] = playback_error
@@ -374,11 +519,10 @@ def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: str, verbose: b
     print(f"    ✓ Playback command succeeded")
     
     # Analyze the recording
-    if recording_result['error']:
-        print(f"    ✗ Recording failed: {recording_result['error']}")
+    if recording_error:
+        print(f"    ✗ Recording failed: {recording_error}")
         return result
     
-    recording = recording_result['data']
     if recording is None or len(recording) == 0:
         print(f"    ✗ Recording is empty")
         return result
@@ -394,12 +538,14 @@ def test_audio_path(path: AudioPath, tone: np.ndarray, wav_path: str, verbose: b
         print(f"    ✓ TONE DETECTED! (SNR: {analysis['snr']:.1f}x, freq: {analysis['detected_freq']:.0f}Hz)")
     else:
         reason = []
-        if analysis['rms'] < MIN_RMS_THRESHOLD:
+        if analysis['rms'] <= MIN_RMS_THRESHOLD:
+            # Spectrum was not analyzed, so frequency/SNR are not meaningful
             reason.append(f"RMS too low ({analysis['rms']:.6f})")
-        if not analysis['freq_match']:
-            reason.append(f"Wrong freq ({analysis['detected_freq']:.0f}Hz)")
-        if analysis['snr'] < SNR_THRESHOLD:
-            reason.append(f"SNR too low ({analysis['snr']:.1f}x)")
+        else:
+            if not analysis['freq_match']:
+                reason.append(f"Wrong freq ({analysis['detected_freq']:.0f}Hz)")
+            if analysis['snr'] < SNR_THRESHOLD:
+                reason.append(f"SNR too low ({analysis['snr']:.1f}x)")
         print(f"    ✗ Tone NOT detected: {', '.join(reason)}")
     
     return result
@@ -421,19 +567,22 @@ def run_all_tests(paths: List[AudioPath], verbose: bool = False) -> List[dict]:
     print("Generating test tone...")
     tone = generate_tone(TEST_FREQUENCY, TONE_DURATION, SAMPLE_RATE, TONE_AMPLITUDE)
     
-    # Save to temp WAV file for aplay/mpv
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
-        wav_path = f.name
-    save_tone_wav(tone, SAMPLE_RATE, wav_path)
-    print(f"Saved test tone to: {wav_path}")
+    # Sort paths by priority
+    sorted_paths = sorted(paths, key=lambda p: p.priority)
+    
+    # Save to temp WAV file, only if an aplay/mpv path will play it
+    wav_path = None
+    if any(p.aplay_device or p.mpv_device for p in sorted_paths):
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            wav_path = f.name
+        save_tone_wav(tone, SAMPLE_RATE, wav_path)
+        print(f"Saved test tone to: {wav_path}")
     
     # Check available devices
     print("\nChecking audio devices...")
-    print(f"  Input devices: {sd.query_devices(kind='input')['name']}")
-    print(f"  Output devices: {sd.query_devices(kind='output')['name']}")
-    
-    # Sort paths by priority
-    sorted_paths = sorted(paths, key=lambda p: p.priority)
+    devices, (default_in, default_out) = get_devices()
+    print(f"  Input devices: {devices[default_in]['name'] if default_in >= 0 else 'none'}")
+    print(f"  Output devices: {devices[default_out]['name'] if default_out >= 0 else 'none'}")
     
     results = []
     for path in sorted_paths:
@@ -452,10 +601,11 @@ def run_all_tests(paths: List[AudioPath], verbose: bool = False) -> List[dict]:
             })
     
     # Cleanup
-    try:
-        os.unlink(wav_path)
-    except:
-        pass
+    if wav_path:
+        try:
+            os.unlink(wav_path)
+        except:
+            pass
     
     return results
 